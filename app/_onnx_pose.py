@@ -0,0 +1,136 @@
+"""
+_onnx_pose.py
+Optional batched pose backend for offline processing:
+- runs an ONNX export of MediaPipe's pose landmark model with ONNX Runtime
+- takes a batch of BGR frames per session.run (GPU provider when available)
+- returns MediaPipe NormalizedLandmarkList objects so drawing/metrics are unchanged
+
+The landmark model expects a person roughly centred in frame (MediaPipe
+normally feeds it a detector crop), so this suits single-dancer videos.
+"""
+
+import cv2
+import functools
+import numpy as np
+import os
+from typing import List, Optional
+from mediapipe.framework.formats import landmark_pb2
+
+try:
+    import onnxruntime as ort
+    HAS_ONNXRUNTIME = True
+except ImportError:
+    HAS_ONNXRUNTIME = False
+
+# Default location of the exported model (not shipped with the repo)
+POSE_ONNX_MODEL = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "models", "pose_landmark_full.onnx",
+)
+# The model emits 39 landmarks (33 body + 6 auxiliary), 5 values each
+_MODEL_LANDMARKS = 39
+_BODY_LANDMARKS = 33
+# Pose-presence score below which a frame is treated as having no pose
+_PRESENCE_THRESHOLD = 0.5
+
+
+def _sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+class OnnxPoseEstimator:
+    """Batched pose landmark inference with ONNX Runtime."""
+
+    def __init__(self, model_path: str, providers: Optional[list] = None, session=None):
+        """
+        Load model_path with ONNX Runtime, or wrap an already created
+        InferenceSession-like `session` (model_path is then only used in errors).
+        """
+        if session is None:
+            if providers is None:
+                available = ort.get_available_providers()
+                providers = [p for p in ("CUDAExecutionProvider", "CPUExecutionProvider")
+                             if p in available]
+            session = ort.InferenceSession(model_path, providers=providers)
+        self._session = session
+        inp = self._session.get_inputs()[0]
+        self._input_name = inp.name
+        # Exports come as NHWC (tf2onnx) or NCHW; batch dim may be fixed (often to 1)
+        self._nchw = inp.shape[1] == 3
+        self._size = int(inp.shape[2] if self._nchw else inp.shape[1])
+        self._fixed_batch = inp.shape[0] if isinstance(inp.shape[0], int) else None
+        # Pick the landmark and pose-presence outputs by shape; export order varies
+        self._coords_name = self._flag_name = None
+        for out in self._session.get_outputs():
+            tail = [d for d in out.shape[1:] if isinstance(d, int)]
+            if tail and tail[-1] == _MODEL_LANDMARKS * 5:
+                self._coords_name = out.name
+            elif tail and int(np.prod(tail)) == 1 and self._flag_name is None:
+                self._flag_name = out.name
+        if self._coords_name is None or self._flag_name is None:
+            raise ValueError(f"Not a pose landmark model: {model_path}")
+
+    def _letterbox(self, frame, out):
+        """Fit frame into out (size x size RGB in [0, 1]); return (new_w, new_h, pad_x, pad_y)."""
+        h, w = frame.shape[:2]
+        scale = self._size / max(h, w)
+        new_w, new_h = max(1, int(w * scale)), max(1, int(h * scale))
+        pad_x, pad_y = (self._size - new_w) // 2, (self._size - new_h) // 2
+        small = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_AREA)
+        out.fill(0.0)
+        out[pad_y:pad_y + new_h, pad_x:pad_x + new_w] = small[:, :, ::-1] * (1.0 / 255.0)
+        return new_w, new_h, pad_x, pad_y
+
+    def process_batch(self, frames: List[np.ndarray]) -> list:
+        """Run one inference over BGR frames; None marks frames with no pose."""
+        if not frames:
+            return []
+        batch = np.empty((len(frames), self._size, self._size, 3), dtype=np.float32)
+        boxes = [self._letterbox(f, batch[i]) for i, f in enumerate(frames)]
+        if self._nchw:
+            batch = np.ascontiguousarray(batch.transpose(0, 3, 1, 2))
+
+        names = [self._coords_name, self._flag_name]
+        if self._fixed_batch:
+            # Run in model-sized slices, zero-padding the last one
+            n = self._fixed_batch
+            coords, presence = [], []
+            for start in range(0, len(frames), n):
+                part = batch[start:start + n]
+                if len(part) < n:
+                    pad = np.zeros((n - len(part), *part.shape[1:]), dtype=part.dtype)
+                    part = np.concatenate([part, pad])
+                c, p = self._session.run(names, {self._input_name: part})
+                coords.append(c.reshape(n, -1))
+                presence.append(p.reshape(n))
+            coords = np.concatenate(coords)[:len(frames)]
+            presence = np.concatenate(presence)[:len(frames)]
+        else:
+            coords, presence = self._session.run(names, {self._input_name: batch})
+
+        coords = coords.reshape(len(frames), _MODEL_LANDMARKS, 5)
+        presence = presence.reshape(len(frames))
+        results = []
+        for (new_w, new_h, pad_x, pad_y), lm, score in zip(boxes, coords, presence):
+            if score < _PRESENCE_THRESHOLD:
+                results.append(None)
+                continue
+            pose = landmark_pb2.NormalizedLandmarkList()
+            for x, y, z, vis, pres in lm[:_BODY_LANDMARKS]:
+                pose.landmark.add(
+                    x=float((x - pad_x) / new_w),
+                    y=float((y - pad_y) / new_h),
+                    z=float(z / new_w),
+                    visibility=float(_sigmoid(vis)),
+                    presence=float(_sigmoid(pres)),
+                )
+            results.append(pose)
+        return results
+
+
+@functools.lru_cache(maxsize=1)
+def get_onnx_estimator(model_path: str = POSE_ONNX_MODEL) -> Optional[OnnxPoseEstimator]:
+    """Shared estimator for model_path, or None if onnxruntime or the model is missing."""
+    if not HAS_ONNXRUNTIME or not os.path.isfile(model_path):
+        return None
+    return OnnxPoseEstimator(model_path)
@@ -0,0 +1,287 @@
+"""
+_video_io.py
+Video capture/writer factories for the processor:
+- opens captures with FFmpeg hardware-accelerated decoding when available
+- encodes through an ffmpeg subprocess with a hardware H.264 encoder
+  (NVENC / VAAPI / VideoToolbox) when one works on this machine
+- for short clips without one, buffers frames in memory and encodes them in
+  one pass with PyAV at release
+- falls back to OpenCV's software 'mp4v' VideoWriter otherwise
+"""
+
+import cv2
+import functools
+import numpy as np
+import shutil
+import subprocess
+import tempfile
+from fractions import Fraction
+from typing import Callable, Optional, Tuple
+
+try:
+    import av
+    HAS_AV = True
+except ImportError:
+    HAS_AV = False
+
+# Hardware encoders to try, in order, with the ffmpeg args each one needs
+HW_ENCODERS = (
+    ("h264_nvenc", [], ["-c:v", "h264_nvenc", "-preset", "p1", "-pix_fmt", "yuv420p"]),
+    ("h264_vaapi", ["-vaapi_device", "/dev/dri/renderD128"],
+     ["-vf", "format=nv12,hwupload", "-c:v", "h264_vaapi"]),
+    ("h264_videotoolbox", [], ["-c:v", "h264_videotoolbox", "-pix_fmt", "yuv420p"]),
+)
+
+# Largest frame buffer (bytes) BufferedWriter may preallocate
+MEMORY_ENCODE_LIMIT = 256 * 1024 * 1024
+
+# Fixed stream used to check which hardware encoders work on this machine
+_PROBE_SIZE = (256, 256)
+_PROBE_FPS = 30
+# Frame sizes whose per-size encoder check is remembered
+_SIZE_CACHE = 32
+# Leading frames FFmpegWriter keeps so it can replay them into a software
+# writer if ffmpeg rejects the stream (that happens as the encoder opens)
+_FALLBACK_FRAMES = 4
+
+
+class FFmpegWriter:
+    """
+    cv2.VideoWriter-compatible writer that pipes raw BGR frames to ffmpeg.
+
+    If `fallback` (a callable returning another writer) is given and ffmpeg
+    fails within the first _FALLBACK_FRAMES frames, those frames are replayed
+    into the fallback writer, which then takes over the rest of the stream.
+    """
+
+    def __init__(self, output_path: str, fps: float, size: Tuple[int, int],
+                 input_args: list, output_args: list, fallback: Optional[Callable] = None):
+        width, height = size
+        self._fallback = fallback
+        self._early = [] if fallback is not None else None
+        self._writer = None
+        cmd = [
+            "ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+            *input_args,
+            "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}",
+            "-r", str(fps), "-i", "-",
+            *output_args,
+            output_path,
+        ]
+        # stderr goes to a file: a pipe nobody reads until release() could fill
+        # up during a long encode and block ffmpeg (and so the writer thread)
+        self._stderr = tempfile.TemporaryFile()
+        try:
+            self._proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=self._stderr)
+        except OSError:
+            self._stderr.close()
+            raise
+
+    def isOpened(self) -> bool:
+        if self._writer is not None:
+            return self._writer.isOpened()
+        return self._proc.poll() is None
+
+    def write(self, frame) -> None:
+        if self._writer is not None:
+            self._writer.write(frame)
+            return
+        if self._early is not None:
+            self._early.append(frame.copy())
+            if len(self._early) > _FALLBACK_FRAMES:
+                self._early = None
+        try:
+            self._proc.stdin.write(frame.tobytes())
+        except OSError:
+            if not self._switch_to_fallback():
+                raise
+
+    def _finish(self) -> str:
+        """Close ffmpeg's input, wait for it and return its stderr (once)."""
+        if self._stderr.closed:
+            return ""
+        if self._proc.stdin and not self._proc.stdin.closed:
+            try:
+                self._proc.stdin.close()
+            except BrokenPipeError:
+                pass
+        self._proc.wait()
+        self._stderr.seek(0)
+        err = self._stderr.read().decode(errors="replace").strip()
+        self._stderr.close()
+        return err
+
+    def _switch_to_fallback(self) -> bool:
+        """Hand the stream to the fallback writer if ffmpeg failed early enough to replay."""
+        if self._early is None:
+            return False
+        early, self._early = self._early, None
+        self._finish()
+        self._writer = self._fallback()
+        for frame in early:
+            self._writer.write(frame)
+        return True
+
+    def release(self) -> None:
+        if self._writer is None:
+            err = self._finish()
+            if self._proc.returncode == 0:
+                return
+            if not self._switch_to_fallback():
+                raise IOError(f"ffmpeg encoder failed: {err}")
+        self._writer.release()
+
+    def abort(self) -> None:
+        """Stop ffmpeg without waiting for it to finish the file."""
+        if self._writer is not None:
+            getattr(self._writer, "abort", self._writer.release)()
+            return
+        self._proc.kill()
+        try:
+            self._proc.stdin.close()
+        except OSError:
+            pass
+        self._proc.wait()
+        self._stderr.close()
+
+
+class BufferedWriter:
+    """cv2.VideoWriter-compatible writer that holds frames in memory and encodes once with PyAV."""
+
+    def __init__(self, output_path: str, fps: float, size: Tuple[int, int], capacity: int):
+        width, height = size
+        self._path = output_path
+        self._fps = fps
+        self._frames = np.empty((capacity, height, width, 3), dtype=np.uint8)
+        self._count = 0
+
+    def isOpened(self) -> bool:
+        return True
+
+    def write(self, frame) -> None:
+        if self._count == len(self._frames):
+            # Frame count was under-reported; grow the buffer
+            grown = np.empty((2 * len(self._frames), *self._frames.shape[1:]), dtype=np.uint8)
+            grown[:self._count] = self._frames
+            self._frames = grown
+        self._frames[self._count] = frame
+        self._count += 1
+
+    def abort(self) -> None:
+        """Drop buffered frames without encoding; release() then does nothing."""
+        self._frames = None
+
+    def release(self) -> None:
+        """Encode all buffered frames to the output file."""
+        if self._frames is None:
+            return
+        frames, self._frames = self._frames[:self._count], None
+        height, width = frames.shape[1:3]
+        with av.open(self._path, "w") as container:
+            stream = container.add_stream(_av_codec(),
+                                          rate=Fraction(self._fps).limit_denominator(1001))
+            stream.width, stream.height = width, height
+            stream.pix_fmt = "yuv420p"
+            for frame in frames:
+                container.mux(stream.encode(av.VideoFrame.from_ndarray(frame, format="bgr24")))
+            container.mux(stream.encode())
+
+
+@functools.lru_cache(maxsize=1)
+def _av_codec() -> str:
+    """libx264 if this PyAV build can encode with it, else FFmpeg's mpeg4 (same as 'mp4v')."""
+    try:
+        av.Codec("libx264", "w")
+        return "libx264"
+    except Exception:
+        return "mpeg4"
+
+
+def _probe_encoder(encoder: tuple, size: Tuple[int, int]) -> bool:
+    """Whether ffmpeg can encode a short bgr24 clip of this size with encoder."""
+    _, input_args, output_args = encoder
+    width, height = size
+    cmd = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        *input_args,
+        "-f", "lavfi", "-i", f"color=c=black:s={width}x{height}:r={_PROBE_FPS},format=bgr24",
+        "-frames:v", "3",
+        *output_args,
+        "-f", "null", "-",
+    ]
+    try:
+        return subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                              timeout=10).returncode == 0
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+
+
+@functools.lru_cache(maxsize=1)
+def _available_hw_encoders() -> tuple:
+    """Entries of HW_ENCODERS that work on this machine, probed once at a fixed size."""
+    if shutil.which("ffmpeg") is None:
+        return ()
+    return tuple(enc for enc in HW_ENCODERS if _probe_encoder(enc, _PROBE_SIZE))
+
+
+@functools.lru_cache(maxsize=_SIZE_CACHE)
+def _hw_encoder(size: Tuple[int, int]) -> Optional[tuple]:
+    """
+    Return the first available hardware encoder that accepts this frame size,
+    or None.
+
+    Hardware encoders can reject sizes even when they are otherwise available,
+    so each new size gets one short check. The frame rate is not part of the
+    check; a stream the encoder still rejects falls back inside FFmpegWriter.
+    """
+    for encoder in _available_hw_encoders():
+        if size == _PROBE_SIZE or _probe_encoder(encoder, size):
+            return encoder
+    return None
+
+
+def open_capture(input_path: str):
+    """Open input_path, requesting hardware-accelerated decoding from the FFmpeg backend."""
+    cap = cv2.VideoCapture(
+        input_path, cv2.CAP_FFMPEG,
+        [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY],
+    )
+    if not cap.isOpened():
+        cap = cv2.VideoCapture(input_path)
+    return cap
+
+
+def open_writer(output_path: str, fps: float, size: Tuple[int, int], expected_frames: int = 0):
+    """
+    Open a writer for output_path, preferring a hardware H.264 encoder.
+
+    Without one, or if ffmpeg rejects the stream as it starts encoding, clips
+    whose expected_frames fit in MEMORY_ENCODE_LIMIT are buffered and encoded
+    in one pass with PyAV; anything else streams through OpenCV's mp4v writer.
+    """
+    width, height = size
+    # H.264 with 4:2:0 chroma needs even dimensions
+    even = width % 2 == 0 and height % 2 == 0
+    encoder = _hw_encoder(size) if even else None
+    if encoder is not None:
+        _, input_args, output_args = encoder
+        try:
+            return FFmpegWriter(
+                output_path, fps, size, input_args, output_args,
+                fallback=functools.partial(_software_writer, output_path, fps, size,
+                                           expected_frames),
+            )
+        except OSError:
+            pass
+    return _software_writer(output_path, fps, size, expected_frames)
+
+
+def _software_writer(output_path: str, fps: float, size: Tuple[int, int], expected_frames: int):
+    """BufferedWriter for short clips that fit MEMORY_ENCODE_LIMIT, else OpenCV's mp4v writer."""
+    width, height = size
+    even = width % 2 == 0 and height % 2 == 0
+    if HAS_AV and even and 0 < expected_frames * width * height * 3 <= MEMORY_ENCODE_LIMIT:
+        return BufferedWriter(output_path, fps, size, expected_frames)
+
+    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+    return cv2.VideoWriter(output_path, fourcc, fps, size)
@@ -5,49 +5,157 @@ FastAPI app exposing /analyze endpoint:
 - returns processed video file (skeleton overlay) + movement metrics
 """
 
+import asyncio
+import io
+import secrets
 import shutil
-import uuid
 import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from fastapi import FastAPI, File, UploadFile, HTTPException
 from fastapi.responses import FileResponse, JSONResponse
-from pathlib import Path
-from .processor import process_video
+from starlette.concurrency import run_in_threadpool
+from ._onnx_pose import POSE_ONNX_MODEL, get_onnx_estimator
+from .processor import configure_opencv, process_video
 
 app = FastAPI(title="Dance Movement Analyzer")
 
-TMP_DIR = Path("/tmp/dance_analyzer")
-TMP_DIR.mkdir(parents=True, exist_ok=True)
+TMP_DIR = "/tmp/dance_analyzer"
+os.makedirs(TMP_DIR, exist_ok=True)
 
-ALLOWED_EXT = {".mp4", ".mov", ".avi", ".mkv", ".webm"}
+ALLOWED_EXT = frozenset({".mp4", ".mov", ".avi", ".mkv", ".webm"})
+
+# Videos are processed on a small fixed pool so each thread keeps and reuses
+# its MediaPipe Pose instance across requests
+PROCESS_WORKERS = 2
+_process_pool = ThreadPoolExecutor(max_workers=PROCESS_WORKERS, thread_name_prefix="process")
+configure_opencv(PROCESS_WORKERS)
+
+# Opt-in batched ONNX pose backend (ANALYZER_ONNX_POSE=1). It runs without
+# MediaPipe's person-detector crop, so it is never picked just because the
+# model file exists; enabling it without the model fails here at startup
+# rather than on every request.
+USE_ONNX_POSE = os.environ.get("ANALYZER_ONNX_POSE", "").lower() in {"1", "true", "yes"}
+if USE_ONNX_POSE and get_onnx_estimator() is None:
+    raise RuntimeError("ANALYZER_ONNX_POSE is set but onnxruntime or " + POSE_ONNX_MODEL
+                       + " is missing")
+# Frames per inference batch with the ONNX backend; /analyze is offline so the
+# added latency per batch doesn't matter
+ANALYZE_BATCH_SIZE = 8
+
+# Copy buffer for uploads when a zero-copy sendfile isn't possible
+UPLOAD_CHUNK = 1 << 20
+# sendfile(2) only copies file-to-file on Linux (macOS/BSD need a socket as
+# the destination); same gate as shutil's _USE_CP_SENDFILE
+_USE_SENDFILE = hasattr(os, "sendfile") and sys.platform.startswith("linux")
+
+
+def _in_memory(src) -> bool:
+    """
+    True if src is an upload still held in memory.
+
+    Reads SpooledTemporaryFile's private _rolled flag, the same check
+    Starlette's UploadFile._in_memory uses; calling fileno() instead would
+    force an in-memory upload to disk.
+    """
+    return isinstance(src, io.BytesIO) or not getattr(src, "_rolled", True)
+
+
+def _sendfile_upload(src, dst) -> bool:
+    """Copy the rest of src into dst with sendfile; False if it isn't possible."""
+    try:
+        src_fd = src.fileno()
+    except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+        return False
+    src.flush()
+    start = offset = src.tell()
+    try:
+        size = os.fstat(src_fd).st_size
+        while offset < size:
+            sent = os.sendfile(dst.fileno(), src_fd, offset, size - offset)
+            if sent == 0:
+                break
+            offset += sent
+    except OSError:
+        # Undo any partial copy so the caller can fall back cleanly
+        dst.seek(0)
+        dst.truncate()
+        src.seek(start)
+        return False
+    src.seek(offset)
+    return True
+
+
+def _save_upload(src, dst_path) -> None:
+    """Copy an uploaded file object to dst_path, using sendfile when src is a real file."""
+    with open(dst_path, "wb") as dst:
+        # Spooled uploads past the memory threshold are backed by a temp file
+        if _USE_SENDFILE and not _in_memory(src) and _sendfile_upload(src, dst):
+            return
+        shutil.copyfileobj(src, dst, length=UPLOAD_CHUNK)
+
+
+def _analyze(in_path: str, out_path: str, write_video: bool = True, sample: bool = False):
+    """Run process_video for /analyze, with batched ONNX inference when it is enabled."""
+    backend, batch_size = ("onnx", ANALYZE_BATCH_SIZE) if USE_ONNX_POSE else ("mediapipe", 1)
+    return process_video(
+        in_path,
+        out_path,
+        target_fps=None,
+        max_frames=300,
+        return_metrics=True,
+        annotate=False,
+        batch_size=batch_size,
+        write_video=write_video,
+        sample=sample,
+        backend=backend
+    )
+
+
+def _cleanup_upload(src, path) -> None:
+    """Close the uploaded file object and remove its saved copy, ignoring errors."""
+    try:
+        src.close()
+    except Exception:
+        pass
+    try:
+        if os.path.exists(path):
+            os.remove(path)
+    except Exception:
+        pass
 
 
 @app.post("/analyze")
-async def analyze_video(file: UploadFile = File(...)):
-    """Analyze uploaded dance video and return processed output + movement metrics."""
-    fname = Path(file.filename)
-    ext = fname.suffix.lower()
+async def analyze_video(
+    file: UploadFile = File(...), metrics_only: bool = False, sample: bool = False
+):
+    """
+    Analyze uploaded dance video and return processed output + movement metrics.
+    With ?metrics_only=true no skeleton video is encoded and only metrics are returned.
+    With ?sample=true videos longer than 300 frames are sampled evenly end to end.
+    """
+    ext = os.path.splitext(file.filename or "")[1].lower()
     if ext not in ALLOWED_EXT:
         raise HTTPException(status_code=415, detail=f"Unsupported file type: {ext}")
 
-    unique = uuid.uuid4().hex
-    in_path = TMP_DIR / f"{unique}_input{ext}"
-    out_path = TMP_DIR / f"{unique}_output.mp4"
+    unique = secrets.token_hex(16)
+    in_path = f"{TMP_DIR}/{unique}_input{ext}"
+    out_path = f"{TMP_DIR}/{unique}_output.mp4"
 
     try:
         # Save uploaded file to disk
-        with open(in_path, "wb") as f:
-            shutil.copyfileobj(file.file, f)
+        await run_in_threadpool(_save_upload, file.file, in_path)
 
         # Process video and collect metrics
-        frames_written, fps, metrics = process_video(
-            str(in_path),
-            str(out_path),
-            target_fps=None,
-            max_frames=300,
-            return_metrics=True
+        loop = asyncio.get_running_loop()
+        frames_written, fps, metrics = await loop.run_in_executor(
+            _process_pool, partial(_analyze, in_path, out_path, not metrics_only, sample)
         )
 
-        if frames_written == 0 or not out_path.exists():
+        if frames_written == 0:
+            raise HTTPException(status_code=500, detail="Processing produced no output.")
+        if not metrics_only and not await run_in_threadpool(os.path.exists, out_path):
             raise HTTPException(status_code=500, detail="Processing produced no output.")
 
         # Embed metrics into response headers for convenience
@@ -62,7 +170,7 @@ async def analyze_video(file: UploadFile = File(...)):
         return JSONResponse(
             content={
                 "message": "Processing complete.",
-                "output_video": f"/download/{unique}",
+                "output_video": None if metrics_only else f"/download/{unique}",
                 "metrics": metrics,
             },
             headers=headers
@@ -74,21 +182,13 @@ async def analyze_video(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail=f"Internal processing error: {e}")
     finally:
         # Cleanup uploaded input file
-        try:
-            file.file.close()
-        except Exception:
-            pass
-        try:
-            if in_path.exists():
-                in_path.unlink()
-        except Exception:
-            pass
+        await run_in_threadpool(_cleanup_upload, file.file, in_path)
 
 
 @app.get("/download/{file_id}")
 async def download_video(file_id: str):
     """Download processed video by ID."""
-    out_path = TMP_DIR / f"{file_id}_output.mp4"
-    if not out_path.exists():
+    out_path = f"{TMP_DIR}/{file_id}_output.mp4"
+    if not await run_in_threadpool(os.path.exists, out_path):
         raise HTTPException(status_code=404, detail="File not found.")
-    return FileResponse(str(out_path), media_type="video/mp4", filename=f"{file_id}_skeleton.mp4")
+    return FileResponse(out_path, media_type="video/mp4", filename=f"{file_id}_skeleton.mp4")
@@ -3,18 +3,245 @@ processor.py
 MediaPipe + OpenCV video processor:
 - reads an input video
 - runs MediaPipe Pose detection per-frame
-- draws skeleton overlay and writes output mp4
+- draws skeleton overlay and writes output mp4 (hardware-encoded when possible)
 - computes basic movement metrics
+
+Decoding, pose detection and encoding run as a 3-stage pipeline: a reader
+thread decodes frames ahead, the calling thread runs MediaPipe (which keeps
+per-stream state and must stay on one thread), and a writer thread encodes.
 """
 
 import cv2
 import numpy as np
 import os
+import queue
+import threading
 from typing import Tuple
 import mediapipe as mp
+from mediapipe.framework.formats import landmark_pb2
+from ._metrics import movement_metrics
+from ._onnx_pose import POSE_ONNX_MODEL, get_onnx_estimator
+from ._video_io import open_capture, open_writer
 
 mp_pose = mp.solutions.pose
-mp_drawing = mp.solutions.drawing_utils
+
+# Skeleton overlay: landmark dots, connection lines (BGR)
+_LANDMARK_COLOR = (0, 255, 0)
+_CONNECTION_COLOR = (0, 0, 255)
+_VISIBILITY_THRESHOLD = 0.5
+_PRESENCE_THRESHOLD = 0.5
+# (K, 2) landmark index pairs joined by a skeleton line
+_CONN_PAIRS = np.array(sorted(mp_pose.POSE_CONNECTIONS), dtype=np.intp)
+
+# Longest side (px) of the frame handed to MediaPipe; landmarks come back
+# normalized to [0, 1], so drawing on the full-resolution frame is unaffected
+POSE_INPUT_SIZE = 256
+# Landmarks returned by MediaPipe Pose
+NUM_LANDMARKS = 33
+# Shoulder, elbow, wrist, hip, knee, ankle landmark indices per body side
+_LEFT_IDX = np.array([11, 13, 15, 23, 25, 27], dtype=np.intp)
+_RIGHT_IDX = np.array([12, 14, 16, 24, 26, 28], dtype=np.intp)
+# Max frames buffered between pipeline stages
+PREFETCH = 8
+# Smallest frame gap worth a container seek rather than grabbing through it
+SEEK_MIN_GAP = 30
+# Marks the end of a pipeline stage's stream
+_SENTINEL = None
+# One Pose graph per thread: loading it is slow and it is not thread-safe
+_pose_tls = threading.local()
+# How often blocked stages re-check the stop flag (seconds)
+_POLL = 0.1
+# Whether pose-input preprocessing goes through OpenCL UMat (see configure_opencv)
+_use_umat = False
+# Pose backends process_video can run: per-stream MediaPipe Pose, or the batched
+# ONNX export of its landmark model (no person-detector crop, see _onnx_pose.py)
+POSE_BACKENDS = ("mediapipe", "onnx")
+
+
+def configure_opencv(num_workers: int = 1, use_opencl: bool = False) -> None:
+    """
+    Tune OpenCV for num_workers videos processed concurrently in this process.
+
+    Splits the CPU cores between workers so OpenCV's parallel loops don't
+    oversubscribe alongside the reader/writer threads. With use_opencl=True,
+    resize + BGR->RGB for the pose input run through cv2.UMat when an OpenCL
+    device is present (e.g. an integrated GPU); otherwise the CPU path is kept.
+    """
+    global _use_umat
+    cv2.setNumThreads(max(1, (os.cpu_count() or 1) // max(1, num_workers)))
+    # Leave OpenCV's process-wide OpenCL setting alone unless asked to use it
+    _use_umat = False
+    if use_opencl:
+        cv2.ocl.setUseOpenCL(True)
+        _use_umat = cv2.ocl.haveOpenCL() and cv2.ocl.useOpenCL()
+
+
+def _get_pose():
+    """Return this thread's cached Pose, reset for a new video, creating it on first use."""
+    pose = getattr(_pose_tls, "pose", None)
+    if pose is None:
+        pose = mp_pose.Pose(static_image_mode=False,
+                            min_detection_confidence=0.5,
+                            min_tracking_confidence=0.5)
+        _pose_tls.pose = pose
+    else:
+        # Drop tracking state left over from the previous video
+        pose.reset()
+    return pose
+
+
+def _discard_pose():
+    """Close and forget this thread's cached Pose (e.g. after a failed run)."""
+    pose = getattr(_pose_tls, "pose", None)
+    _pose_tls.pose = None
+    if pose is not None:
+        try:
+            pose.close()
+        except Exception:
+            pass
+
+
+def _draw_pose(frame, pose_landmarks) -> None:
+    """Draw the pose skeleton onto frame in place with two vectorized OpenCV calls."""
+    h, w = frame.shape[:2]
+    lm = np.array(
+        [(p.x, p.y,
+          p.visibility if p.HasField("visibility") else 1.0,
+          p.presence if p.HasField("presence") else 1.0)
+         for p in pose_landmarks.landmark],
+        dtype=np.float32,
+    )
+    pts = (lm[:, :2] * (w, h)).astype(np.int32)
+    # Same rule as mp_drawing: skip landmarks that are off-frame, not visible or not present
+    shown = ((lm[:, 2] >= _VISIBILITY_THRESHOLD) & (lm[:, 3] >= _PRESENCE_THRESHOLD)
+             & (lm[:, 0] >= 0) & (lm[:, 0] <= 1) & (lm[:, 1] >= 0) & (lm[:, 1] <= 1))
+
+    pairs = _CONN_PAIRS[shown[_CONN_PAIRS].all(axis=1)]
+    if len(pairs):
+        cv2.polylines(frame, pts[pairs], False, _CONNECTION_COLOR, 2)
+    if shown.any():
+        # A one-point closed polyline renders as a filled dot of the line thickness
+        cv2.polylines(frame, pts[shown][:, None, :], True, _LANDMARK_COLOR, 5)
+
+
+def _interpolate_pose(a, b, t: float):
+    """Linearly interpolate landmark positions from a (t=0) to b (t=1)."""
+    out = landmark_pb2.NormalizedLandmarkList()
+    out.CopyFrom(a)
+    for lm, lb in zip(out.landmark, b.landmark):
+        lm.x += t * (lb.x - lm.x)
+        lm.y += t * (lb.y - lm.y)
+        lm.z += t * (lb.z - lm.z)
+    return out
+
+
+def _abort_writer(writer) -> None:
+    """Discard a writer after a failed run, using its abort() when it has one."""
+    try:
+        getattr(writer, "abort", writer.release)()
+    except Exception:
+        pass
+
+
+def _put(q: queue.Queue, item, stop: threading.Event) -> bool:
+    """Put item on q, giving up if stop is set. Returns True if the item was queued."""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=_POLL)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(q: queue.Queue, stop: threading.Event):
+    """Get an item from q, returning _SENTINEL if stop is set first."""
+    while not stop.is_set():
+        try:
+            return q.get(timeout=_POLL)
+        except queue.Empty:
+            continue
+    return _SENTINEL
+
+
+def _skip_frames(cap, n: int, target: int, seekable: bool) -> Tuple[bool, bool]:
+    """
+    Advance cap past n frames so the next read returns frame `target` (0-based).
+
+    Large gaps seek with CAP_PROP_POS_FRAMES; small gaps, or containers that
+    refuse the seek, grab and discard frames instead.
+
+    Returns:
+        (ok, seekable): ok is False at end of stream; seekable is False once a seek failed
+    """
+    if seekable and n >= SEEK_MIN_GAP:
+        if cap.set(cv2.CAP_PROP_POS_FRAMES, target):
+            return True, True
+        seekable = False
+    for _ in range(n):
+        if not cap.grab():
+            return False, seekable
+    return True, seekable
+
+
+def _source_frame(frame_idx: int, sample_ratio: float) -> int:
+    """0-based source frame read as the frame_idx-th (0-based) frame when sampling."""
+    return round(frame_idx * sample_ratio)
+
+
+def _read_frames(cap, read_q: queue.Queue, max_frames, stop: threading.Event, errors: list,
+                 decode_stride: int = 1, sample_ratio: float = 1.0):
+    """
+    Reader stage: decode frames into read_q as (frame_idx, frame), then a sentinel.
+
+    Only every decode_stride-th frame is decoded; the others are grabbed
+    (demuxed but not decoded) and queued with frame=None. With sample_ratio > 1
+    the frame_idx-th frame read is source frame _source_frame(frame_idx - 1,
+    sample_ratio), so frames are spread evenly at a fractional spacing, and
+    frame_idx counts sampled frames.
+    """
+    try:
+        frame_idx = 0
+        # Source frame the next read returns
+        position = 0
+        seekable = True
+        while not stop.is_set():
+            if sample_ratio > 1:
+                target = _source_frame(frame_idx, sample_ratio)
+                ok, seekable = _skip_frames(cap, target - position, target, seekable)
+                if not ok:
+                    break
+                position = target
+            if frame_idx % decode_stride:
+                ret, frame = cap.grab(), None
+            else:
+                ret, frame = cap.read()
+            if not ret:
+                break
+            position += 1
+            frame_idx += 1
+            if max_frames and frame_idx > max_frames:
+                break
+            if not _put(read_q, (frame_idx, frame), stop):
+                break
+    except Exception as e:
+        errors.append(e)
+        stop.set()
+    finally:
+        _put(read_q, _SENTINEL, stop)
+
+
+def _write_frames(writer, write_q: queue.Queue, stop: threading.Event, errors: list):
+    """Writer stage: encode frames from write_q until the sentinel arrives."""
+    try:
+        while True:
+            frame = _get(write_q, stop)
+            if frame is _SENTINEL:
+                break
+            writer.write(frame)
+    except Exception as e:
+        errors.append(e)
+        stop.set()
 
 
 def process_video(
@@ -22,26 +249,54 @@ def process_video(
     output_path: str,
     target_fps: float = None,
     max_frames: int = None,
-    return_metrics: bool = False
+    return_metrics: bool = False,
+    stride: int = 1,
+    annotate: bool = False,
+    batch_size: int = 1,
+    write_video: bool = True,
+    sample: bool = False,
+    backend: str = "mediapipe"
 ) -> Tuple[int, float, dict]:
     """
     Processes input video and writes an output video with skeleton overlay + metrics.
 
     Args:
         input_path: path to input video file
-        output_path: path where result video will be saved
+        output_path: path where result video will be saved (unused if write_video=False)
         target_fps: if set, force output FPS; otherwise uses input FPS
         max_frames: if set, process only up to max_frames frames (useful for tests)
         return_metrics: if True, also return movement metrics
+        stride: run pose detection on every stride-th frame only; the skeleton on
+            frames in between is linearly interpolated
+        annotate: if True, draw a "Frame: i/N" label on each frame (diagnostic only)
+        batch_size: inferred frames handed to the pose backend per call; only the
+            ONNX backend runs them as one batch, MediaPipe still goes frame by frame
+        write_video: if False, only compute metrics: no output video is encoded or
+            drawn, and frames skipped by stride are not decoded
+        sample: if True and the video is longer than max_frames, read max_frames
+            frames spread evenly across the whole video instead of the first ones
+            (at a fractional spacing, so clips of any length are covered end to
+            end); output FPS (unless target_fps is set) and movement intensity are
+            scaled so they still refer to source frames
+        backend: pose backend, one of POSE_BACKENDS; "onnx" needs onnxruntime
+            and the exported model (see _onnx_pose.py)
 
     Returns:
         (frames_written, output_fps, metrics) or (frames_written, output_fps)
     """
 
+    if stride < 1:
+        raise ValueError(f"stride must be >= 1, got {stride}")
+    if batch_size < 1:
+        raise ValueError(f"batch_size must be >= 1, got {batch_size}")
+    if backend not in POSE_BACKENDS:
+        raise ValueError(f"backend must be one of {POSE_BACKENDS}, got {backend!r}")
+    if backend == "onnx" and get_onnx_estimator() is None:
+        raise ValueError("backend='onnx' needs onnxruntime and " + POSE_ONNX_MODEL)
     if not os.path.isfile(input_path):
         raise FileNotFoundError(f"Input file not found: {input_path}")
 
-    cap = cv2.VideoCapture(input_path)
+    cap = open_capture(input_path)
     if not cap.isOpened():
         raise IOError(f"Cannot open video: {input_path}")
 
@@ -49,19 +304,39 @@ def process_video(
     width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH) or 640)
     height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT) or 480)
     input_frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
-    out_fps = float(target_fps) if target_fps else in_fps
+    # Sample mode reads one source frame per sample_ratio frames
+    sample_ratio = 1.0
+    if sample and max_frames and input_frame_count > max_frames:
+        sample_ratio = input_frame_count / max_frames
+    # Sampled output keeps the source duration unless an FPS is forced
+    out_fps = float(target_fps) if target_fps else in_fps / sample_ratio
 
-    # Setup VideoWriter
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    writer = cv2.VideoWriter(output_path, fourcc, out_fps, (width, height))
-    if not writer.isOpened():
-        cap.release()
-        raise IOError("Could not open VideoWriter - check codecs and container environment")
+    # Pose detection runs on a downscaled copy; drawing/encoding stay full-res
+    scale = POSE_INPUT_SIZE / max(width, height)
+    pose_size = (int(width * scale), int(height * scale)) if scale < 1.0 else None
+    pose_w, pose_h = pose_size or (width, height)
+    # Reused per frame so resize/cvtColor don't allocate new images
+    small_buf = np.empty((pose_h, pose_w, 3), dtype=np.uint8) if pose_size else None
+    rgb_buf = np.empty((pose_h, pose_w, 3), dtype=np.uint8)
 
-    # Initialize MediaPipe Pose
-    pose = mp_pose.Pose(static_image_mode=False,
-                        min_detection_confidence=0.5,
-                        min_tracking_confidence=0.5)
+    # Setup writer (hardware H.264 via ffmpeg, one-pass PyAV encode for short
+    # clips, else OpenCV mp4v)
+    writer = None
+    if write_video:
+        expected_frames = max_frames or input_frame_count
+        if max_frames and input_frame_count:
+            expected_frames = min(max_frames, input_frame_count)
+        writer = open_writer(output_path, out_fps, (width, height), expected_frames)
+        if not writer.isOpened():
+            cap.release()
+            raise IOError("Could not open VideoWriter - check codecs and container environment")
+
+    # Batched ONNX backend if requested, otherwise this thread's MediaPipe Pose
+    estimator, pose = None, None
+    if backend == "onnx":
+        estimator = get_onnx_estimator()
+    else:
+        pose = _get_pose()
 
     # --- Metrics ---
     metrics = {
@@ -70,68 +345,192 @@ def process_video(
         "avg_movement_intensity": 0.0,
         "dominant_limb": None,
     }
-    prev_landmarks = None
-    movement_accumulator = 0.0
-    total_points = 0
-    left_movement, right_movement = 0.0, 0.0
+    # (x, y) landmarks of every inferred frame with a pose, in order; metrics
+    # are computed over the whole buffer once the video is done
+    capacity = (max_frames or input_frame_count or 256) // stride + 1
+    all_landmarks = np.empty((capacity, NUM_LANDMARKS, 2), dtype=np.float32)
+    n_landmarks = 0
 
-    frame_idx = 0
     written = 0
 
-    try:
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            frame_idx += 1
-            if max_frames and frame_idx > max_frames:
-                break
+    # --- Pipeline: reader thread -> pose (this thread) -> writer thread ---
+    read_q = queue.Queue(maxsize=PREFETCH)
+    write_q = queue.Queue(maxsize=PREFETCH)
+    stop = threading.Event()
+    errors = []
+    # Without an output video, frames between inferred ones are never looked at
+    decode_stride = 1 if write_video else stride
+    reader_thread = threading.Thread(
+        target=_read_frames,
+        args=(cap, read_q, max_frames, stop, errors, decode_stride, sample_ratio),
+        daemon=True
+    )
+    reader_thread.start()
+    writer_thread = None
+    if write_video:
+        writer_thread = threading.Thread(
+            target=_write_frames, args=(writer, write_q, stop, errors), daemon=True
+        )
+        writer_thread.start()
 
-            rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            results = pose.process(rgb)
+    def emit(frame_idx, frame, pose_landmarks) -> bool:
+        """Draw pose_landmarks (if any) and optionally the frame label, then queue the frame."""
+        nonlocal written
+        if not write_video:
+            written += 1
+            return True
+        if pose_landmarks:
+            _draw_pose(frame, pose_landmarks)
 
-            if results.pose_landmarks:
-                metrics["frames_with_pose"] += 1
-                mp_drawing.draw_landmarks(
-                    frame,
-                    results.pose_landmarks,
-                    mp_pose.POSE_CONNECTIONS,
-                    mp_drawing.DrawingSpec(color=(0, 255, 0), thickness=2, circle_radius=2),
-                    mp_drawing.DrawingSpec(color=(0, 0, 255), thickness=2, circle_radius=2),
-                )
+        if annotate:
+            # Label with the source frame number, also when sampling
+            source_idx = _source_frame(frame_idx - 1, sample_ratio) + 1
+            cv2.putText(frame, f"Frame: {source_idx}/{input_frame_count}",
+                        (10, 20), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
 
-                landmarks = np.array([(lm.x, lm.y) for lm in results.pose_landmarks.landmark])
+        if not _put(write_q, frame, stop):
+            return False
+        written += 1
+        return True
 
-                if prev_landmarks is not None and landmarks.shape == prev_landmarks.shape:
-                    diff = np.linalg.norm(landmarks - prev_landmarks, axis=1)
-                    movement_accumulator += diff.sum()
-                    total_points += len(diff)
+    def infer_mediapipe(frames) -> list:
+        """Run this thread's MediaPipe Pose on each frame in turn."""
+        poses = []
+        for frame in frames:
+            if _use_umat:
+                # T-API: resize + convert on the OpenCL device, download once
+                small = cv2.UMat(frame)
+                if pose_size is not None:
+                    small = cv2.resize(small, pose_size, interpolation=cv2.INTER_AREA)
+                rgb = cv2.cvtColor(small, cv2.COLOR_BGR2RGB).get()
+                rgb.flags.writeable = False
+                poses.append(pose.process(rgb).pose_landmarks)
+                continue
 
-                    left_idx = [11, 13, 15, 23, 25, 27]
-                    right_idx = [12, 14, 16, 24, 26, 28]
-                    left_movement += diff[left_idx].sum()
-                    right_movement += diff[right_idx].sum()
+            small = frame
+            if pose_size is not None:
+                small = cv2.resize(frame, pose_size, dst=small_buf,
+                                   interpolation=cv2.INTER_AREA)
+            rgb_buf.flags.writeable = True
+            cv2.cvtColor(small, cv2.COLOR_BGR2RGB, dst=rgb_buf)
+            # Read-only input lets MediaPipe wrap the buffer without copying it
+            rgb_buf.flags.writeable = False
+            poses.append(pose.process(rgb_buf).pose_landmarks)
+        return poses
 
-                prev_landmarks = landmarks
+    infer = estimator.process_batch if estimator is not None else infer_mediapipe
 
-            # Annotate frame number
-            cv2.putText(frame, f"Frame: {frame_idx}/{input_frame_count}",
-                        (10, 20), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+    # Frames decoded since the last inferred frame, waiting to be interpolated
+    pending = []
+    last_pose = None
 
-            writer.write(frame)
-            written += 1
+    def handle_inferred(frame_idx, frame, cur_pose) -> bool:
+        """Emit pending frames up to this inferred one, record its landmarks, emit it."""
+        nonlocal last_pose, all_landmarks, n_landmarks
+
+        # Skipped frames get a skeleton interpolated between the two inferred poses
+        for k, (p_idx, p_frame) in enumerate(pending, 1):
+            interp = None
+            # Nothing is drawn without an output video
+            if write_video and last_pose and cur_pose:
+                interp = _interpolate_pose(last_pose, cur_pose, k / (len(pending) + 1))
+            if not emit(p_idx, p_frame, interp):
+                return False
+        pending.clear()
+
+        if cur_pose:
+            if n_landmarks == len(all_landmarks):
+                # Frame count was under-reported; grow the buffer
+                grown = np.empty((2 * len(all_landmarks), NUM_LANDMARKS, 2), dtype=np.float32)
+                grown[:n_landmarks] = all_landmarks
+                all_landmarks = grown
+            row = all_landmarks[n_landmarks]
+            lms = cur_pose.landmark
+            for i in range(NUM_LANDMARKS):
+                lm = lms[i]
+                row[i, 0] = lm.x
+                row[i, 1] = lm.y
+            n_landmarks += 1
+
+        last_pose = cur_pose
+        return emit(frame_idx, frame, cur_pose)
+
+    # Decoded frames whose inferred members haven't been run through the model yet
+    chunk = []
 
+    def flush_chunk() -> bool:
+        """Infer every inferred frame in chunk in one batch, then handle frames in order."""
+        poses = iter(infer([f for i, f in chunk if not (i - 1) % stride]))
+        for frame_idx, frame in chunk:
+            if (frame_idx - 1) % stride:
+                pending.append((frame_idx, frame))
+            elif not handle_inferred(frame_idx, frame, next(poses)):
+                return False
+        chunk.clear()
+        return True
+
+    failed = False
+    try:
+        n_batched = 0
+        while True:
+            item = _get(read_q, stop)
+            if item is _SENTINEL:
+                break
+            chunk.append(item)
+            if (item[0] - 1) % stride:
+                continue
+            n_batched += 1
+            if n_batched == batch_size:
+                n_batched = 0
+                if not flush_chunk():
+                    break
+
+        # Trailing frames after the last inferred one reuse its pose
+        if not stop.is_set() and flush_chunk():
+            for p_idx, p_frame in pending:
+                if not emit(p_idx, p_frame, last_pose):
+                    break
+
+    except BaseException:
+        failed = True
+        stop.set()
+        if pose is not None:
+            _discard_pose()
+        raise
     finally:
-        pose.close()
-        writer.release()
+        # Let the writer drain what is queued, then stop the reader
+        if writer_thread is not None:
+            _put(write_q, _SENTINEL, stop)
+            writer_thread.join()
+        stop.set()
+        reader_thread.join()
         cap.release()
+        if writer is not None:
+            if failed or errors:
+                # Don't finish encoding a failed run (or let that mask its error)
+                _abort_writer(writer)
+            else:
+                writer.release()
+
+    if errors:
+        raise errors[0]
 
     # Finalize metrics
     metrics["frames_processed"] = written
-    if total_points > 0:
-        metrics["avg_movement_intensity"] = round(movement_accumulator / total_points, 5)
-        metrics["dominant_limb"] = "left" if left_movement > right_movement else "right"
+    # Only inferred frames count as detections; each stands for stride frames,
+    # as in the intensity normalization below
+    metrics["frames_with_pose"] = min(written, n_landmarks * stride)
+    if n_landmarks > 1:
+        total, left, right, count = movement_metrics(
+            all_landmarks[:n_landmarks], _LEFT_IDX, _RIGHT_IDX
+        )
+        # Movement between inferred frames spans stride * sample_ratio source frames
+        metrics["avg_movement_intensity"] = round(total / (count * stride * sample_ratio), 5)
+        metrics["dominant_limb"] = "left" if left > right else "right"
 
     if return_metrics:
         return written, out_fps, metrics
     return written, out_fps
+
+
+configure_opencv()
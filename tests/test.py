@@ -10,7 +10,10 @@ import os
 import cv2
 import numpy as np
 import pytest
-from app.processor import process_video
+from types import SimpleNamespace
+from mediapipe.framework.formats import landmark_pb2
+from app import processor
+from app.processor import _draw_pose, _interpolate_pose, process_video
 
 
 def create_synthetic_video(path, width=160, height=120, fps=10, frames=15):
@@ -26,6 +29,36 @@ def create_synthetic_video(path, width=160, height=120, fps=10, frames=15):
     writer.release()
 
 
+def make_pose(x, y, z=0.0, n=33, visibility=1.0):
+    """NormalizedLandmarkList with all n landmarks at (x, y, z)."""
+    pose = landmark_pb2.NormalizedLandmarkList()
+    for _ in range(n):
+        pose.landmark.add(x=x, y=y, z=z, visibility=visibility)
+    return pose
+
+
+class FakePose:
+    """Stand-in for mediapipe Pose: the i-th call is assumed to see source frame
+    i * stride, and every landmark sits at x = 0.1 + step * source_frame.
+    Calls whose index is in `missing` detect no pose."""
+
+    def __init__(self, stride, step=0.01, missing=()):
+        self.stride, self.step, self.calls = stride, step, 0
+        self.missing = set(missing)
+
+    def process(self, rgb):
+        x = 0.1 + self.step * self.calls * self.stride
+        found = self.calls not in self.missing
+        self.calls += 1
+        return SimpleNamespace(pose_landmarks=make_pose(x, 0.5) if found else None)
+
+    def reset(self):
+        pass
+
+    def close(self):
+        pass
+
+
 def test_process_creates_output(tmp_path):
     """Ensure that process_video() creates an output file and returns metrics."""
     in_v = tmp_path / "in.mp4"
@@ -54,5 +87,300 @@ def test_process_creates_output(tmp_path):
     assert 0 <= metrics["avg_movement_intensity"] < 1
 
 
+def test_process_respects_max_frames(tmp_path):
+    """The reader stage stops after max_frames and every frame reaches the writer."""
+    in_v = tmp_path / "in.mp4"
+    out_v = tmp_path / "out.mp4"
+    create_synthetic_video(str(in_v), frames=15)
+
+    frames_written, _, metrics = process_video(
+        str(in_v),
+        str(out_v),
+        max_frames=5,
+        return_metrics=True
+    )
+
+    assert frames_written == 5
+    assert metrics["frames_processed"] == 5
+
+    cap = cv2.VideoCapture(str(out_v))
+    assert int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) == 5
+    cap.release()
+
+
+def test_process_with_stride_writes_every_frame(tmp_path):
+    """Frames skipped by pose detection are still written in order."""
+    in_v = tmp_path / "in.mp4"
+    out_v = tmp_path / "out.mp4"
+    create_synthetic_video(str(in_v), frames=10)
+
+    frames_written, _, metrics = process_video(
+        str(in_v),
+        str(out_v),
+        return_metrics=True,
+        stride=3
+    )
+
+    assert frames_written == 10
+    assert metrics["frames_processed"] == 10
+    assert 0 <= metrics["avg_movement_intensity"] < 1
+
+
+def test_interpolate_pose_endpoints_and_midpoint():
+    """t=0 gives a, t=1 gives b, t=0.5 the midpoint; visibility comes from a."""
+    a = make_pose(0.2, 0.4, z=-0.2, visibility=0.9)
+    b = make_pose(0.6, 0.8, z=0.2, visibility=0.1)
+
+    for t, (x, y, z) in [(0.0, (0.2, 0.4, -0.2)), (0.5, (0.4, 0.6, 0.0)), (1.0, (0.6, 0.8, 0.2))]:
+        out = _interpolate_pose(a, b, t)
+        assert len(out.landmark) == 33
+        for lm in out.landmark:
+            assert lm.x == pytest.approx(x)
+            assert lm.y == pytest.approx(y)
+            assert lm.z == pytest.approx(z, abs=1e-6)
+            assert lm.visibility == pytest.approx(0.9)
+    # Inputs are left untouched
+    assert a.landmark[0].x == pytest.approx(0.2)
+
+
+@pytest.mark.parametrize("stride", [1, 3])
+def test_stride_keeps_movement_intensity_per_frame(tmp_path, monkeypatch, stride):
+    """Inferred poses stride frames apart are normalized back to per-frame movement."""
+    fake = FakePose(stride)
+    monkeypatch.setattr(processor, "_get_pose", lambda: fake)
+    in_v = tmp_path / "in.mp4"
+    create_synthetic_video(str(in_v), frames=13)
+
+    frames_written, _, metrics = process_video(
+        str(in_v),
+        str(tmp_path / "out.mp4"),
+        return_metrics=True,
+        stride=stride
+    )
+
+    assert frames_written == 13
+    assert fake.calls == len(range(0, 13, stride))
+    assert metrics["frames_with_pose"] == 13
+    assert metrics["avg_movement_intensity"] == pytest.approx(0.01, abs=1e-4)
+
+
+@pytest.mark.parametrize("stride", [1, 3])
+def test_frames_with_pose_counts_inferred_detections(tmp_path, monkeypatch, stride):
+    """A missed detection costs stride frames; interpolated or reused skeletons don't count."""
+    monkeypatch.setattr(processor, "_get_pose", lambda: FakePose(stride, missing={1}))
+    in_v = tmp_path / "in.mp4"
+    create_synthetic_video(str(in_v), frames=13)
+
+    _, _, metrics = process_video(
+        str(in_v),
+        str(tmp_path / "out.mp4"),
+        return_metrics=True,
+        stride=stride
+    )
+
+    # stride 3 infers 5 of the 13 frames; the 4 detections stand for 3 frames each
+    assert metrics["frames_with_pose"] == 12
+
+
+def test_draw_pose_skips_hidden_landmarks():
+    """Visible landmarks and their connections are drawn; hidden or off-frame ones are not."""
+    pose = make_pose(1.5, 1.5)  # everything off-frame by default
+    lms = pose.landmark
+    nose, l_shoulder, r_shoulder, l_elbow, r_elbow = (lms[i] for i in (0, 11, 12, 13, 14))
+    nose.x, nose.y = 0.5, 0.2
+    l_shoulder.x, l_shoulder.y = 0.3, 0.5
+    r_shoulder.x, r_shoulder.y = 0.7, 0.5
+    l_elbow.x, l_elbow.y, l_elbow.presence = 0.2, 0.8, 0.1
+    r_elbow.x, r_elbow.y, r_elbow.visibility = 0.8, 0.8, 0.1
+    frame = np.zeros((100, 100, 3), dtype=np.uint8)
+
+    _draw_pose(frame, pose)
+
+    assert tuple(frame[20, 50]) == (0, 255, 0)   # nose dot
+    assert tuple(frame[50, 50]) == (0, 0, 255)   # shoulder-shoulder line
+    assert not frame[80, 20].any()               # low-presence elbow
+    assert not frame[65, 25].any()               # ...and its connection
+    assert not frame[80, 80].any()               # low-visibility elbow
+    assert not frame[65, 75].any()
+
+
+def test_process_rejects_invalid_stride(tmp_path):
+    """stride must be a positive frame count."""
+    with pytest.raises(ValueError):
+        process_video(str(tmp_path / "in.mp4"), str(tmp_path / "out.mp4"), stride=0)
+
+
+def test_process_rejects_unknown_backend(tmp_path):
+    """backend must name one of POSE_BACKENDS."""
+    with pytest.raises(ValueError):
+        process_video(str(tmp_path / "in.mp4"), str(tmp_path / "out.mp4"), backend="openpose")
+
+
+def test_batch_size_keeps_mediapipe_backend(tmp_path, monkeypatch):
+    """batch_size only groups frames; without backend='onnx' MediaPipe still runs each one."""
+    fake = FakePose(stride=2)
+    monkeypatch.setattr(processor, "_get_pose", lambda: fake)
+    monkeypatch.setattr(processor, "get_onnx_estimator", lambda: pytest.fail("ONNX used"))
+    in_v = tmp_path / "in.mp4"
+    create_synthetic_video(str(in_v), frames=13)
+
+    frames_written, _, metrics = process_video(
+        str(in_v),
+        str(tmp_path / "out.mp4"),
+        return_metrics=True,
+        stride=2,
+        batch_size=4
+    )
+
+    assert frames_written == 13
+    assert fake.calls == len(range(0, 13, 2))
+    assert metrics["avg_movement_intensity"] == pytest.approx(0.01, abs=1e-4)
+
+
+def test_process_metrics_only(tmp_path):
+    """write_video=False computes metrics without creating an output video."""
+    in_v = tmp_path / "in.mp4"
+    out_v = tmp_path / "out.mp4"
+    create_synthetic_video(str(in_v), frames=12)
+
+    frames_written, _, metrics = process_video(
+        str(in_v),
+        str(out_v),
+        return_metrics=True,
+        stride=2,
+        write_video=False
+    )
+
+    assert not out_v.exists()
+    assert frames_written == 12
+    assert metrics["frames_processed"] == 12
+    assert 0 <= metrics["avg_movement_intensity"] < 1
+
+
+def create_indexed_video(path, width=160, height=120, fps=10, frames=30):
+    """Generate flat gray frames whose brightness encodes the frame index (8 * i)."""
+    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+    writer = cv2.VideoWriter(path, fourcc, fps, (width, height))
+    for i in range(frames):
+        writer.write(np.full((height, width, 3), 8 * i, dtype=np.uint8))
+    writer.release()
+
+
+@pytest.mark.parametrize("frames, expected", [
+    (30, list(range(0, 30, 3))),
+    # Not a multiple of max_frames: spacing 2.5, still reaching the end of the clip
+    (25, [0, 2, 5, 8, 10, 12, 15, 18, 20, 22]),
+])
+def test_process_samples_long_video(tmp_path, frames, expected):
+    """sample=True reads evenly spaced frames and keeps the source duration."""
+    in_v = tmp_path / "in.mp4"
+    out_v = tmp_path / "out.mp4"
+    create_indexed_video(str(in_v), fps=10, frames=frames)
+
+    frames_written, fps, metrics = process_video(
+        str(in_v),
+        str(out_v),
+        max_frames=10,
+        return_metrics=True,
+        sample=True
+    )
+
+    assert frames_written == 10
+    assert metrics["frames_processed"] == 10
+    assert fps == pytest.approx(10 / (frames / 10))
+
+    cap = cv2.VideoCapture(str(out_v))
+    indices = []
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        indices.append(int(round(frame.mean() / 8)))
+    cap.release()
+    assert indices == expected
+
+
+def test_sample_annotates_source_frame_numbers(tmp_path, monkeypatch):
+    """The diagnostic label shows the source frame number, not the sampled one."""
+    labels = []
+    real_put_text = processor.cv2.putText
+
+    def record(img, text, *args, **kwargs):
+        labels.append(text)
+        return real_put_text(img, text, *args, **kwargs)
+
+    monkeypatch.setattr(processor.cv2, "putText", record)
+    in_v = tmp_path / "in.mp4"
+    create_synthetic_video(str(in_v), frames=25)
+
+    process_video(
+        str(in_v),
+        str(tmp_path / "out.mp4"),
+        max_frames=10,
+        annotate=True,
+        sample=True
+    )
+
+    assert labels == [f"Frame: {i}/25" for i in (1, 3, 6, 9, 11, 13, 16, 19, 21, 23)]
+
+
+def test_sample_keeps_movement_intensity_per_frame(tmp_path, monkeypatch):
+    """Sampled poses sample_ratio frames apart are normalized back to per-frame movement."""
+    fake = FakePose(stride=3)  # i-th call sees source frame 3 * i
+    monkeypatch.setattr(processor, "_get_pose", lambda: fake)
+    in_v = tmp_path / "in.mp4"
+    create_synthetic_video(str(in_v), frames=30)
+
+    _, _, metrics = process_video(
+        str(in_v),
+        str(tmp_path / "out.mp4"),
+        max_frames=10,
+        return_metrics=True,
+        sample=True
+    )
+
+    assert fake.calls == 10
+    assert metrics["avg_movement_intensity"] == pytest.approx(0.01, abs=1e-4)
+
+
+def test_failed_run_aborts_writer(tmp_path, monkeypatch):
+    """A failing run aborts the writer instead of finishing the encode, and
+    the original error is what propagates."""
+
+    class RecordingWriter:
+        def __init__(self):
+            self.aborted = self.released = False
+
+        def isOpened(self):
+            return True
+
+        def write(self, frame):
+            pass
+
+        def abort(self):
+            self.aborted = True
+
+        def release(self):
+            self.released = True
+            raise AssertionError("release() must not run after a failure")
+
+    class FailingPose(FakePose):
+        def process(self, rgb):
+            raise RuntimeError("pose failed")
+
+    writer = RecordingWriter()
+    monkeypatch.setattr(processor, "open_writer", lambda *args: writer)
+    monkeypatch.setattr(processor, "_get_pose", lambda: FailingPose(1))
+    monkeypatch.setattr(processor, "_discard_pose", lambda: None)
+    in_v = tmp_path / "in.mp4"
+    create_synthetic_video(str(in_v), frames=5)
+
+    with pytest.raises(RuntimeError, match="pose failed"):
+        process_video(str(in_v), str(tmp_path / "out.mp4"))
+
+    assert writer.aborted
+    assert not writer.released
+
+
 if __name__ == "__main__":
     pytest.main([__file__])
@@ -0,0 +1,91 @@
+"""
+Unit tests for the API helpers.
+_save_upload must copy both in-memory and rolled-over spooled uploads intact,
+using sendfile only for the latter and falling back to a plain copy when
+sendfile fails or isn't usable on the platform.
+"""
+
+import os
+import tempfile
+import pytest
+from app import api
+
+
+@pytest.fixture
+def sendfile_calls(monkeypatch):
+    """Record calls to os.sendfile while still performing them."""
+    calls = []
+    real_sendfile = os.sendfile
+
+    def spy(*args):
+        calls.append(args)
+        return real_sendfile(*args)
+
+    monkeypatch.setattr(api.os, "sendfile", spy)
+    monkeypatch.setattr(api, "_USE_SENDFILE", True)
+    return calls
+
+
+def _spooled_upload(data: bytes, rolled: bool):
+    src = tempfile.SpooledTemporaryFile(max_size=1 << 20)
+    src.write(data)
+    if rolled:
+        src.rollover()
+    src.seek(0)
+    return src
+
+
+@pytest.mark.parametrize("rolled", [False, True])
+def test_save_upload_copies_spooled_file(tmp_path, sendfile_calls, rolled):
+    """Uploads held in memory are copied; rolled-over ones go through sendfile."""
+    data = os.urandom(300_000)
+    src = _spooled_upload(data, rolled)
+    dst = tmp_path / "upload.bin"
+
+    api._save_upload(src, str(dst))
+
+    assert dst.read_bytes() == data
+    assert bool(sendfile_calls) == rolled
+    src.close()
+
+
+def test_save_upload_falls_back_when_sendfile_fails(tmp_path, monkeypatch):
+    """A sendfile error (e.g. ENOTSOCK on macOS) mid-copy ends in a complete plain copy."""
+    data = os.urandom(300_000)
+    real_sendfile = os.sendfile
+    calls = []
+
+    def flaky(out_fd, in_fd, offset, count):
+        calls.append(offset)
+        if len(calls) > 1:
+            raise OSError(38, "sendfile failed")
+        return real_sendfile(out_fd, in_fd, offset, min(count, 1000))
+
+    monkeypatch.setattr(api.os, "sendfile", flaky)
+    monkeypatch.setattr(api, "_USE_SENDFILE", True)
+    src = _spooled_upload(data, rolled=True)
+    dst = tmp_path / "upload.bin"
+
+    api._save_upload(src, str(dst))
+
+    assert len(calls) == 2
+    assert dst.read_bytes() == data
+    src.close()
+
+
+def test_save_upload_skips_sendfile_off_linux(tmp_path, sendfile_calls, monkeypatch):
+    """Where sendfile can't copy between files, rolled-over uploads are copied in chunks."""
+    monkeypatch.setattr(api, "_USE_SENDFILE", False)
+    data = os.urandom(300_000)
+    src = _spooled_upload(data, rolled=True)
+    dst = tmp_path / "upload.bin"
+
+    api._save_upload(src, str(dst))
+
+    assert dst.read_bytes() == data
+    assert not sendfile_calls
+    src.close()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
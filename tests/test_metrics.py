@@ -0,0 +1,40 @@
+"""
+Unit tests for the movement metric kernel.
+The active kernel (Numba or NumPy) must agree with the NumPy reference.
+"""
+
+import numpy as np
+import pytest
+from app._metrics import _movement_metrics_numpy, movement_metrics
+from app.processor import _LEFT_IDX, _RIGHT_IDX
+
+
+def test_movement_metrics_matches_numpy_reference():
+    """Totals and per-side sums match the NumPy implementation."""
+    rng = np.random.default_rng(0)
+    landmarks = rng.random((12, 33, 2), dtype=np.float32)
+
+    total, left, right, count = movement_metrics(landmarks, _LEFT_IDX, _RIGHT_IDX)
+    ref = _movement_metrics_numpy(landmarks, _LEFT_IDX, _RIGHT_IDX)
+
+    assert count == ref[3] == 11 * 33
+    assert total == pytest.approx(ref[0], rel=1e-5)
+    assert left == pytest.approx(ref[1], rel=1e-5)
+    assert right == pytest.approx(ref[2], rel=1e-5)
+
+
+def test_movement_metrics_two_frames():
+    """A known displacement between two frames is summed per side."""
+    landmarks = np.zeros((2, 33, 2), dtype=np.float32)
+    landmarks[1, 11] = (0.3, 0.4)  # left shoulder moves by 0.5
+
+    total, left, right, count = movement_metrics(landmarks, _LEFT_IDX, _RIGHT_IDX)
+
+    assert count == 33
+    assert total == pytest.approx(0.5)
+    assert left == pytest.approx(0.5)
+    assert right == pytest.approx(0.0)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,76 @@
+"""
+Unit tests for the batched ONNX pose backend's post-processing.
+A stub session stands in for ONNX Runtime, so no model file is needed.
+"""
+
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from app._onnx_pose import OnnxPoseEstimator
+
+
+class StubSession:
+    """InferenceSession-like stub with a fixed or dynamic batch dimension.
+
+    Every image gets all 39 landmarks at pixel (px, py) of the 256x256 model
+    input; presence scores are taken from `scores` in call order."""
+
+    def __init__(self, batch, px, py, scores):
+        self._batch, self._px, self._py = batch, px, py
+        self._scores = list(scores)
+        self.input_shapes = []
+
+    def get_inputs(self):
+        return [SimpleNamespace(name="input_1", shape=[self._batch, 256, 256, 3])]
+
+    def get_outputs(self):
+        return [SimpleNamespace(name="Identity", shape=[self._batch, 195]),
+                SimpleNamespace(name="Identity_1", shape=[self._batch, 1])]
+
+    def run(self, names, feeds):
+        batch = feeds["input_1"]
+        self.input_shapes.append(batch.shape)
+        n = len(batch)
+        lm = np.zeros((n, 39, 5), dtype=np.float32)
+        lm[:, :, 0], lm[:, :, 1] = self._px, self._py
+        scores = [self._scores.pop(0) if self._scores else 0.0 for _ in range(n)]
+        return [lm.reshape(n, 195), np.array(scores, dtype=np.float32).reshape(n, 1)]
+
+
+def test_process_batch_unmaps_letterbox_and_thresholds_presence():
+    """Landmarks map back to frame-normalized coords; low presence yields None."""
+    # 512x256 frame -> scaled to 256x128, padded by 64 rows top and bottom
+    session = StubSession(batch="N", px=128.0, py=64.0 + 32.0, scores=[0.9, 0.1])
+    estimator = OnnxPoseEstimator("stub.onnx", session=session)
+    frames = [np.zeros((256, 512, 3), dtype=np.uint8)] * 2
+
+    poses = estimator.process_batch(frames)
+
+    assert session.input_shapes == [(2, 256, 256, 3)]
+    assert poses[1] is None
+    assert len(poses[0].landmark) == 33
+    lm = poses[0].landmark[0]
+    assert lm.x == pytest.approx(0.5)
+    assert lm.y == pytest.approx(0.25)
+    # Zero logits -> sigmoid 0.5
+    assert lm.visibility == pytest.approx(0.5)
+    assert lm.presence == pytest.approx(0.5)
+
+
+@pytest.mark.parametrize("fixed_batch", [1, 8])
+def test_process_batch_pads_fixed_batch_models(fixed_batch):
+    """Models with a fixed batch dim run in padded slices of exactly that size."""
+    session = StubSession(batch=fixed_batch, px=128.0, py=128.0, scores=[0.9] * 16)
+    estimator = OnnxPoseEstimator("stub.onnx", session=session)
+    frames = [np.zeros((256, 256, 3), dtype=np.uint8)] * 3
+
+    poses = estimator.process_batch(frames)
+
+    assert len(poses) == 3
+    assert all(p is not None for p in poses)
+    assert all(shape[0] == fixed_batch for shape in session.input_shapes)
+    assert len(session.input_shapes) == -(-3 // fixed_batch)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,175 @@
+"""
+Unit tests for the video writer factory.
+open_writer must fall back to OpenCV's mp4v writer when no hardware encoder
+works for the stream, encoders are probed once per machine (and once per
+size), and FFmpegWriter must hand a rejected stream to its fallback or
+surface ffmpeg failures.
+"""
+
+import shutil
+import cv2
+import numpy as np
+import pytest
+from app import _video_io
+from app._video_io import BufferedWriter, FFmpegWriter, open_writer
+
+needs_ffmpeg = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg not installed")
+needs_av = pytest.mark.skipif(not _video_io.HAS_AV, reason="PyAV not installed")
+
+
+@pytest.fixture(autouse=True)
+def fresh_probe():
+    """Encoder probe results are cached per machine and size; start every test clean."""
+    _video_io._available_hw_encoders.cache_clear()
+    _video_io._hw_encoder.cache_clear()
+    yield
+    _video_io._available_hw_encoders.cache_clear()
+    _video_io._hw_encoder.cache_clear()
+
+
+def _write_and_count(writer, path, frames=5, size=(64, 48)):
+    width, height = size
+    for i in range(frames):
+        writer.write(np.full((height, width, 3), i * 40, dtype=np.uint8))
+    writer.release()
+    cap = cv2.VideoCapture(str(path))
+    count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    return count
+
+
+def test_open_writer_falls_back_without_ffmpeg(tmp_path, monkeypatch):
+    """No ffmpeg binary (and no PyAV) means the OpenCV mp4v writer."""
+    monkeypatch.setattr(_video_io.shutil, "which", lambda name: None)
+    monkeypatch.setattr(_video_io, "HAS_AV", False)
+    out = tmp_path / "out.mp4"
+
+    writer = open_writer(str(out), 10.0, (64, 48), expected_frames=5)
+
+    assert isinstance(writer, cv2.VideoWriter)
+    assert _write_and_count(writer, out) == 5
+
+
+@needs_ffmpeg
+def test_open_writer_skips_encoder_failing_probe(tmp_path, monkeypatch):
+    """An encoder that fails the probe is never used."""
+    monkeypatch.setattr(_video_io, "HW_ENCODERS", (("bogus", [], ["-c:v", "no_such_encoder"]),))
+    monkeypatch.setattr(_video_io, "HAS_AV", False)
+    out = tmp_path / "out.mp4"
+
+    writer = open_writer(str(out), 10.0, (64, 48), expected_frames=5)
+
+    assert not isinstance(writer, FFmpegWriter)
+    assert _write_and_count(writer, out) == 5
+
+
+def test_hw_encoder_probes_once_per_encoder_and_size(monkeypatch):
+    """Availability is probed once; each new size costs one check, whatever the fps."""
+    encoders = (("enc_a", [], []), ("enc_b", [], []))
+    probes = []
+
+    def probe(encoder, size):
+        probes.append((encoder[0], size))
+        return encoder[0] == "enc_b"
+
+    monkeypatch.setattr(_video_io.shutil, "which", lambda name: "/usr/bin/ffmpeg")
+    monkeypatch.setattr(_video_io, "HW_ENCODERS", encoders)
+    monkeypatch.setattr(_video_io, "_probe_encoder", probe)
+
+    for size in [(640, 480), (640, 480), (1280, 720), _video_io._PROBE_SIZE]:
+        assert _video_io._hw_encoder(size)[0] == "enc_b"
+
+    assert probes == [
+        ("enc_a", _video_io._PROBE_SIZE), ("enc_b", _video_io._PROBE_SIZE),
+        ("enc_b", (640, 480)), ("enc_b", (1280, 720)),
+    ]
+
+
+class RecordingWriter:
+    def __init__(self):
+        self.frames, self.released = [], False
+
+    def isOpened(self):
+        return True
+
+    def write(self, frame):
+        self.frames.append(int(frame[0, 0, 0]))
+
+    def release(self):
+        self.released = True
+
+
+@needs_ffmpeg
+def test_ffmpeg_writer_hands_rejected_stream_to_fallback(tmp_path):
+    """ffmpeg failing as the encoder opens replays the frames into the fallback writer."""
+    fallback = RecordingWriter()
+    writer = FFmpegWriter(str(tmp_path / "out.mp4"), 10.0, (64, 48),
+                          [], ["-c:v", "no_such_encoder"], fallback=lambda: fallback)
+
+    for i in range(3):
+        writer.write(np.full((48, 64, 3), i, dtype=np.uint8))
+    writer.release()
+
+    assert fallback.frames == [0, 1, 2]
+    assert fallback.released
+
+
+@needs_ffmpeg
+def test_ffmpeg_writer_release_reports_failure(tmp_path):
+    """A failing ffmpeg process raises IOError with its stderr at release."""
+    writer = FFmpegWriter(str(tmp_path / "out.mp4"), 10.0, (64, 48),
+                          [], ["-c:v", "no_such_encoder"])
+    try:
+        writer.write(np.zeros((48, 64, 3), dtype=np.uint8))
+    except BrokenPipeError:
+        pass
+
+    with pytest.raises(IOError, match="ffmpeg encoder failed"):
+        writer.release()
+
+
+@pytest.mark.parametrize("size, expected_frames, limit, expected", [
+    ((64, 48), 5, _video_io.MEMORY_ENCODE_LIMIT, BufferedWriter),
+    ((64, 48), 5, 64 * 48 * 3 * 4, cv2.VideoWriter),   # over the memory limit
+    ((65, 48), 5, _video_io.MEMORY_ENCODE_LIMIT, cv2.VideoWriter),  # odd width
+    ((64, 48), 0, _video_io.MEMORY_ENCODE_LIMIT, cv2.VideoWriter),  # unknown length
+])
+def test_open_writer_buffers_only_small_even_clips(tmp_path, monkeypatch,
+                                                   size, expected_frames, limit, expected):
+    """Without a hardware encoder, only short even-sized clips are buffered in memory."""
+    monkeypatch.setattr(_video_io.shutil, "which", lambda name: None)
+    monkeypatch.setattr(_video_io, "HAS_AV", True)
+    monkeypatch.setattr(_video_io, "MEMORY_ENCODE_LIMIT", limit)
+
+    writer = open_writer(str(tmp_path / "out.mp4"), 10.0, size, expected_frames)
+
+    assert type(writer) is expected
+    if isinstance(writer, BufferedWriter):
+        writer.abort()
+    else:
+        writer.release()
+
+
+@needs_av
+def test_buffered_writer_encodes_all_frames(tmp_path):
+    """Frames past the preallocated capacity are kept and all get encoded at release."""
+    out = tmp_path / "out.mp4"
+    writer = BufferedWriter(str(out), 10.0, (64, 48), capacity=2)
+
+    assert _write_and_count(writer, out, frames=5) == 5
+
+
+def test_buffered_writer_abort_skips_encoding(tmp_path):
+    """abort() discards the buffer; a later release() writes nothing."""
+    out = tmp_path / "out.mp4"
+    writer = BufferedWriter(str(out), 10.0, (64, 48), capacity=5)
+    writer.write(np.zeros((48, 64, 3), dtype=np.uint8))
+
+    writer.abort()
+    writer.release()
+
+    assert not out.exists()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])